@@ -10,22 +10,30 @@ Usage:
     python calendar_shift.py                    # Auto-detect wake time from Oura
     python calendar_shift.py --offset 120       # Manual offset in minutes
     python calendar_shift.py --dry-run          # Preview without changes
+    python calendar_shift.py --no-cache         # Ignore cached wake time and events
 """
 
 import argparse
-import json
 import os
+import re
+import sys
+import threading
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from typing import Optional
 from urllib.parse import urlencode, urlparse, parse_qs
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 # Google Calendar scopes
 SCOPES = ['https://www.googleapis.com/auth/calendar']
@@ -35,9 +43,25 @@ CREDENTIALS_FILE = os.path.join(SCRIPT_DIR, 'credentials.json')
 TOKEN_FILE = os.path.join(SCRIPT_DIR, 'token.json')
 OURA_CREDENTIALS_FILE = os.path.join(SCRIPT_DIR, 'oura_credentials.json')
 OURA_TOKEN_FILE = os.path.join(SCRIPT_DIR, 'oura_token.json')
+OURA_WAKE_CACHE_FILE = os.path.join(SCRIPT_DIR, 'oura_wake_cache.json')
+EXPECTED_WAKE_CACHE_FILE = os.path.join(SCRIPT_DIR, 'expected_wake_cache.json')
+EVENTS_CACHE_FILE = os.path.join(SCRIPT_DIR, 'events_cache.json')
+
+# A cached wake time is trusted once the sleep session ended this long ago
+OURA_WAKE_CACHE_MIN_AGE = timedelta(hours=2)
+# Cached wake times older than this many days are dropped
+WAKE_CACHE_DAYS = 7
 
 # Event names that indicate sleep/wake time
 SLEEP_EVENT_NAMES = ['sleep', 'wake', 'wakeup', 'wake up', 'bedtime']
+_SLEEP_RE = re.compile('|'.join(map(re.escape, SLEEP_EVENT_NAMES)), re.IGNORECASE)
+
+# Google Calendar allows at most 50 requests per batch
+BATCH_SIZE = 50
+
+# Only request the event fields we actually read
+EVENT_LIST_FIELDS = 'etag,items(id,etag,summary,start,end,attendees(email,self)),nextPageToken'
+EVENTS_PAGE_SIZE = 2500
 
 # Oura OAuth2 URLs
 OURA_AUTH_URL = 'https://cloud.ouraring.com/oauth/authorize'
@@ -45,12 +69,42 @@ OURA_TOKEN_URL = 'https://api.ouraring.com/oauth/token'
 OURA_API_BASE = 'https://api.ouraring.com/v2/usercollection'
 OURA_REDIRECT_URI = 'http://localhost:8080/callback'
 
+# Seconds to wait for the user to complete Oura authorization in the browser
+OURA_AUTH_TIMEOUT = 300
+
+# Refresh Oura tokens this many seconds before they expire
+OURA_TOKEN_REFRESH_MARGIN = 120
+
+# Serializes Oura token refreshes, which rotate the refresh token
+_OURA_TOKEN_LOCK = threading.Lock()
+
+# Seconds to wait for Oura to connect or send data before giving up
+OURA_TIMEOUT = 10
+
+# Shared session so Oura requests reuse pooled keep-alive connections
+_OURA = requests.Session()
+_OURA.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False),
+))
+
+
+class CalendarAuthError(Exception):
+    """Raised when Google Calendar credentials are missing or need user action."""
+
 
 class OAuthCallbackHandler(BaseHTTPRequestHandler):
     """Handle OAuth callback from Oura."""
 
     def do_GET(self):
         parsed = urlparse(self.path)
+        if parsed.path == '/favicon.ico':
+            # Browsers request this alongside the callback; answer without a body
+            self.send_response(204)
+            self.end_headers()
+            return
         if parsed.path == '/callback':
             query = parse_qs(parsed.query)
             if 'code' in query:
@@ -59,6 +113,7 @@ class OAuthCallbackHandler(BaseHTTPRequestHandler):
                 self.send_header('Content-type', 'text/html')
                 self.end_headers()
                 self.wfile.write(b'<html><body><h1>Authorization successful!</h1><p>You can close this window.</p></body></html>')
+                self.server.auth_event.set()
             else:
                 self.server.auth_code = None
                 self.send_response(400)
@@ -73,45 +128,64 @@ class OAuthCallbackHandler(BaseHTTPRequestHandler):
         pass  # Suppress logging
 
 
+if sys.version_info >= (3, 11):
+    # fromisoformat accepts a trailing 'Z' natively
+    parse_datetime = datetime.fromisoformat
+else:
+    def parse_datetime(ts: str) -> datetime:
+        """Parse an ISO-8601 timestamp, accepting a trailing 'Z' for UTC."""
+        if ts.endswith('Z'):
+            return datetime.fromisoformat(ts[:-1] + '+00:00')
+        return datetime.fromisoformat(ts)
+
+
 def load_oura_credentials():
     """Load Oura OAuth credentials from file."""
     if not os.path.exists(OURA_CREDENTIALS_FILE):
         return None
-    with open(OURA_CREDENTIALS_FILE, 'r') as f:
-        return json.load(f)
+    with open(OURA_CREDENTIALS_FILE, 'rb') as f:
+        return orjson.loads(f.read())
 
 
 def save_oura_token(token_data):
     """Save Oura OAuth token to file."""
-    with open(OURA_TOKEN_FILE, 'w') as f:
-        json.dump(token_data, f)
+    with open(OURA_TOKEN_FILE, 'wb') as f:
+        f.write(orjson.dumps(token_data))
 
 
 def load_oura_token():
     """Load Oura OAuth token from file."""
     if not os.path.exists(OURA_TOKEN_FILE):
         return None
-    with open(OURA_TOKEN_FILE, 'r') as f:
-        return json.load(f)
+    with open(OURA_TOKEN_FILE, 'rb') as f:
+        return orjson.loads(f.read())
 
 
 def refresh_oura_token(credentials, token_data):
     """Refresh Oura OAuth token."""
-    response = requests.post(OURA_TOKEN_URL, data={
-        'grant_type': 'refresh_token',
-        'refresh_token': token_data['refresh_token'],
-        'client_id': credentials['client_id'],
-        'client_secret': credentials['client_secret'],
-    })
-
-    if response.status_code == 200:
-        new_token = response.json()
-        # Preserve refresh token if not returned
-        if 'refresh_token' not in new_token:
-            new_token['refresh_token'] = token_data['refresh_token']
-        save_oura_token(new_token)
-        return new_token
-    return None
+    with _OURA_TOKEN_LOCK:
+        # Another thread may have refreshed already, spending this refresh token
+        current = load_oura_token()
+        if current and current.get('refresh_token') != token_data.get('refresh_token'):
+            return current
+
+        response = _OURA.post(OURA_TOKEN_URL, data={
+            'grant_type': 'refresh_token',
+            'refresh_token': token_data['refresh_token'],
+            'client_id': credentials['client_id'],
+            'client_secret': credentials['client_secret'],
+        }, timeout=OURA_TIMEOUT)
+
+        if response.status_code == 200:
+            new_token = orjson.loads(response.content)
+            # Preserve refresh token if not returned
+            if 'refresh_token' not in new_token:
+                new_token['refresh_token'] = token_data['refresh_token']
+            if 'expires_in' in new_token:
+                new_token['expires_at'] = datetime.now().timestamp() + new_token['expires_in']
+            save_oura_token(new_token)
+            return new_token
+        return None
 
 
 def get_oura_token():
@@ -126,9 +200,10 @@ def get_oura_token():
 
     # If we have a token, try to use it or refresh it
     if token_data:
-        # Check if token is expired (Oura tokens last 24 hours)
+        # Check if token is expired (Oura tokens last 24 hours), refreshing
+        # a little early so it can't expire mid-run
         if 'expires_at' in token_data:
-            if datetime.now().timestamp() < token_data['expires_at']:
+            if datetime.now().timestamp() < token_data['expires_at'] - OURA_TOKEN_REFRESH_MARGIN:
                 return token_data['access_token']
 
         # Try to refresh
@@ -149,32 +224,38 @@ def get_oura_token():
     auth_url = f"{OURA_AUTH_URL}?{urlencode(auth_params)}"
 
     # Start local server to receive callback
-    server = HTTPServer(('localhost', 8080), OAuthCallbackHandler)
+    server = ThreadingHTTPServer(('localhost', 8080), OAuthCallbackHandler)
     server.auth_code = None
+    server.auth_event = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
 
     webbrowser.open(auth_url)
     print(f"If browser doesn't open, go to:\n{auth_url}")
 
     # Wait for callback
-    while server.auth_code is None:
-        server.handle_request()
+    server.auth_event.wait(timeout=OURA_AUTH_TIMEOUT)
+    server.shutdown()
+    server.server_close()
 
     auth_code = server.auth_code
+    if auth_code is None:
+        print("Error: Timed out waiting for Oura authorization.")
+        return None
 
     # Exchange code for token
-    response = requests.post(OURA_TOKEN_URL, data={
+    response = _OURA.post(OURA_TOKEN_URL, data={
         'grant_type': 'authorization_code',
         'code': auth_code,
         'redirect_uri': OURA_REDIRECT_URI,
         'client_id': credentials['client_id'],
         'client_secret': credentials['client_secret'],
-    })
+    }, timeout=OURA_TIMEOUT)
 
     if response.status_code != 200:
         print(f"Error getting token: {response.text}")
         return None
 
-    token_data = response.json()
+    token_data = orjson.loads(response.content)
     # Add expiration timestamp
     if 'expires_in' in token_data:
         token_data['expires_at'] = datetime.now().timestamp() + token_data['expires_in']
@@ -185,13 +266,59 @@ def get_oura_token():
     return token_data['access_token']
 
 
-def get_oura_wake_time() -> Optional[datetime]:
+def _wake_cache_key(day, calendar_id=None) -> str:
+    """Cache key for a day, scoped to a calendar when one is given."""
+    if calendar_id is None:
+        return day.isoformat()
+    return f"{calendar_id}:{day.isoformat()}"
+
+
+def load_wake_cache(path):
+    """Load cached wake times, keyed by ISO date (optionally calendar-prefixed)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def load_wake_time(path, day, calendar_id=None) -> Optional[str]:
+    """Return the cached wake time for the given day, if any."""
+    return load_wake_cache(path).get(_wake_cache_key(day, calendar_id))
+
+
+def save_wake_time(path, day, wake_time: str, calendar_id=None):
+    """Cache the wake time for the given day, dropping stale entries."""
+    cutoff = (day - timedelta(days=WAKE_CACHE_DAYS)).isoformat()
+    # Every key ends with its ISO date
+    cache = {k: v for k, v in load_wake_cache(path).items() if k[-10:] > cutoff}
+    cache[_wake_cache_key(day, calendar_id)] = wake_time
+    try:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(cache))
+    except OSError:
+        pass  # Caching is best-effort
+
+
+def get_oura_wake_time(use_cache: bool = True) -> Optional[datetime]:
     """Get wake time from Oura Ring API (bedtime_end of last night's sleep)."""
+    today = datetime.now().date()
+
+    if use_cache:
+        cached = load_wake_time(OURA_WAKE_CACHE_FILE, today)
+        if cached:
+            end_dt = parse_datetime(cached)
+            # Only trust sessions that have clearly closed
+            if datetime.now(end_dt.tzinfo) - end_dt >= OURA_WAKE_CACHE_MIN_AGE:
+                print(f"  Using cached wake time: {cached}")
+                return end_dt
+
     token = get_oura_token()
     if not token:
         return None
 
-    today = datetime.now().date()
     # Query a wider range to catch sleep that spans midnight
     three_days_ago = today - timedelta(days=3)
 
@@ -202,32 +329,33 @@ def get_oura_wake_time() -> Optional[datetime]:
     }
 
     try:
-        response = requests.get(
+        response = _OURA.get(
             f'{OURA_API_BASE}/sleep',
             headers=headers,
-            params=params
+            params=params,
+            timeout=OURA_TIMEOUT
         )
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
 
         sleep_sessions = data.get('data', [])
         if not sleep_sessions:
             print("No sleep data found in Oura.")
             return None
 
-        # Find sleep sessions that ended today (morning wake up)
-        today_sessions = []
-        for session in sleep_sessions:
-            bedtime_end = session.get('bedtime_end', '')
-            if bedtime_end:
-                end_dt = datetime.fromisoformat(bedtime_end.replace('Z', '+00:00'))
-                # Check if this sleep ended today
-                if end_dt.date() == today:
-                    today_sessions.append(session)
+        # Find sleep sessions that ended today (morning wake up). ISO-8601
+        # timestamps start with their local date, so a prefix check avoids
+        # parsing every session.
+        today_prefix = today.isoformat()
+        today_sessions = [
+            session for session in sleep_sessions
+            if (session.get('bedtime_end') or '').startswith(today_prefix)
+        ]
 
         if today_sessions:
             # Get the one with latest bedtime_end (most recent wake)
-            latest_sleep = max(today_sessions, key=lambda x: x.get('bedtime_end', ''))
+            latest_sleep = max(today_sessions, key=lambda x: x['bedtime_end'])
+            save_wake_time(OURA_WAKE_CACHE_FILE, today, latest_sleep['bedtime_end'])
         else:
             # Fallback to most recent overall
             print("No sleep ending today found, using most recent session.")
@@ -237,16 +365,19 @@ def get_oura_wake_time() -> Optional[datetime]:
         print(f"  Sleep session: {latest_sleep.get('bedtime_start', 'N/A')} to {bedtime_end}")
 
         if bedtime_end:
-            return datetime.fromisoformat(bedtime_end.replace('Z', '+00:00'))
+            return parse_datetime(bedtime_end)
 
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         print(f"Error fetching Oura data: {e}")
 
     return None
 
 
-def get_calendar_service():
-    """Authenticate and return Google Calendar service."""
+def get_calendar_service(interactive: bool = True):
+    """Authenticate and return Google Calendar service.
+
+    With interactive=False, raise CalendarAuthError instead of opening a browser.
+    """
     creds = None
 
     if os.path.exists(TOKEN_FILE):
@@ -257,40 +388,97 @@ def get_calendar_service():
             creds.refresh(Request())
         else:
             if not os.path.exists(CREDENTIALS_FILE):
-                print(f"Error: {CREDENTIALS_FILE} not found.")
-                print("Please download OAuth credentials from Google Cloud Console.")
-                exit(1)
+                raise CalendarAuthError(
+                    f"{CREDENTIALS_FILE} not found. "
+                    "Please download OAuth credentials from Google Cloud Console."
+                )
+            if not interactive:
+                raise CalendarAuthError(
+                    "Google Calendar authorization required. Run calendar_shift.py once to authorize."
+                )
             flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
 
         with open(TOKEN_FILE, 'w') as token:
             token.write(creds.to_json())
 
-    return build('calendar', 'v3', credentials=creds)
+    # Use the discovery document bundled with the client instead of fetching it
+    return build('calendar', 'v3', credentials=creds, static_discovery=True)
+
+
+def load_events_cache(day, calendar_id) -> Optional[dict]:
+    """Load the cached event list if it is for the given day and calendar."""
+    if not os.path.exists(EVENTS_CACHE_FILE):
+        return None
+    try:
+        with open(EVENTS_CACHE_FILE, 'rb') as f:
+            cache = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if cache.get('date') != day.isoformat() or cache.get('calendar_id') != calendar_id:
+        return None
+    return cache
 
 
-def get_todays_events(service, calendar_id='primary'):
+def save_events_cache(day, calendar_id, etag: str, events):
+    """Cache the event list with its ETag, replacing any earlier day's list."""
+    cache = {'date': day.isoformat(), 'calendar_id': calendar_id, 'etag': etag, 'items': events}
+    try:
+        with open(EVENTS_CACHE_FILE, 'wb') as f:
+            f.write(orjson.dumps(cache))
+    except OSError:
+        pass  # Caching is best-effort
+
+
+def get_todays_events(service, calendar_id='primary', use_cache: bool = True):
     """Fetch all events for today."""
     now = datetime.now()
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_day = start_of_day + timedelta(days=1)
 
-    events_result = service.events().list(
+    request = service.events().list(
         calendarId=calendar_id,
         timeMin=start_of_day.isoformat() + 'Z',
         timeMax=end_of_day.isoformat() + 'Z',
         singleEvents=True,
-        orderBy='startTime'
-    ).execute()
+        orderBy='startTime',
+        maxResults=EVENTS_PAGE_SIZE,
+        fields=EVENT_LIST_FIELDS
+    )
+
+    # Ask the server to skip the body if the list hasn't changed since last run
+    cached = load_events_cache(start_of_day.date(), calendar_id) if use_cache else None
+    if cached:
+        request.headers['If-None-Match'] = cached['etag']
+
+    try:
+        events_result = request.execute()
+    except HttpError as e:
+        if cached and e.resp.status == 304:
+            print("Events unchanged since last run, using cached list.")
+            return cached['items']
+        raise
 
-    return events_result.get('items', [])
+    events = events_result.get('items', [])
+    request = service.events().list_next(request, events_result)
+
+    # The list ETag only covers the first page, so only cache single-page results
+    if request is None and events_result.get('etag'):
+        save_events_cache(start_of_day.date(), calendar_id, events_result['etag'], events)
+
+    while request is not None:
+        request.headers.pop('If-None-Match', None)
+        events_result = request.execute()
+        events.extend(events_result.get('items', []))
+        request = service.events().list_next(request, events_result)
+
+    return events
 
 
 def find_sleep_event(events) -> Optional[dict]:
     """Find the sleep/wake event to determine expected wake time."""
     for event in events:
-        summary = event.get('summary', '').lower()
-        if any(name in summary for name in SLEEP_EVENT_NAMES):
+        if _SLEEP_RE.search(event.get('summary', '')):
             return event
     return None
 
@@ -306,9 +494,16 @@ def get_expected_wake_time(events) -> Optional[datetime]:
     if not end_time_str:
         return None
 
-    if end_time_str.endswith('Z'):
-        return datetime.fromisoformat(end_time_str.replace('Z', '+00:00'))
-    return datetime.fromisoformat(end_time_str)
+    return parse_datetime(end_time_str)
+
+
+def calculate_offset(actual_wake: datetime, expected_wake: datetime) -> int:
+    """Minutes between expected and actual wake, comparing wall-clock times."""
+    actual_wake_naive = actual_wake.replace(tzinfo=None) if actual_wake.tzinfo else actual_wake
+    expected_wake_naive = expected_wake.replace(tzinfo=None) if expected_wake.tzinfo else expected_wake
+
+    offset_delta = actual_wake_naive - expected_wake_naive
+    return int(offset_delta.total_seconds() / 60)
 
 
 def is_solo_event(event, my_email: str) -> bool:
@@ -322,122 +517,226 @@ def is_solo_event(event, my_email: str) -> bool:
     return len(other_attendees) == 0
 
 
-def shift_event(service, event, offset_minutes: int, calendar_id='primary'):
-    """Shift an event by the given offset."""
+def build_shifted_body(event, offset_minutes: int) -> Optional[dict]:
+    """Build a patch body with the event's start/end shifted by the given offset."""
     offset = timedelta(minutes=offset_minutes)
 
     start = event.get('start', {})
     end = event.get('end', {})
 
-    if 'dateTime' in start:
-        start_dt = datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(end['dateTime'].replace('Z', '+00:00'))
+    if 'dateTime' not in start:
+        return None
 
-        new_start = start_dt + offset
-        new_end = end_dt + offset
+    start_dt = parse_datetime(start['dateTime'])
+    end_dt = parse_datetime(end['dateTime'])
 
-        if start['dateTime'].endswith('Z'):
-            event['start']['dateTime'] = new_start.strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
-            event['end']['dateTime'] = new_end.strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
-        else:
-            event['start']['dateTime'] = new_start.isoformat()
-            event['end']['dateTime'] = new_end.isoformat()
+    new_start = start_dt + offset
+    new_end = end_dt + offset
 
-        service.events().update(
-            calendarId=calendar_id,
-            eventId=event['id'],
-            body=event
-        ).execute()
+    new_body = {'start': dict(start), 'end': dict(end)}
+    if start['dateTime'].endswith('Z'):
+        new_body['start']['dateTime'] = new_start.replace(tzinfo=None).isoformat(timespec='seconds') + 'Z'
+        new_body['end']['dateTime'] = new_end.replace(tzinfo=None).isoformat(timespec='seconds') + 'Z'
+    else:
+        new_body['start']['dateTime'] = new_start.isoformat()
+        new_body['end']['dateTime'] = new_end.isoformat()
 
-        return True
-    return False
+    return new_body
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Shift calendar events when waking up late')
-    parser.add_argument('--offset', type=int, help='Offset in minutes (overrides Oura detection)')
-    parser.add_argument('--dry-run', action='store_true', help='Preview without making changes')
-    parser.add_argument('--calendar', type=str, default='primary', help='Calendar ID to use')
-    args = parser.parse_args()
+def shift_events(service, events, offset_minutes: int, calendar_id='primary') -> dict:
+    """Shift events using batched patch requests.
+
+    Returns a dict mapping event ID to the exception raised for it (None on success).
+    """
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[request_id] = exception
 
-    print("Authenticating with Google Calendar...")
-    service = get_calendar_service()
+    for i in range(0, len(events), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for event in events[i:i + BATCH_SIZE]:
+            body = build_shifted_body(event, offset_minutes)
+            if body is None:
+                continue
+            request = service.events().patch(
+                calendarId=calendar_id,
+                eventId=event['id'],
+                body=body
+            )
+            # Don't overwrite an event that changed since it was listed
+            if 'etag' in event:
+                request.headers['If-Match'] = event['etag']
+            batch.add(request, request_id=event['id'])
+        batch.execute()
 
-    calendar = service.calendars().get(calendarId=args.calendar).execute()
-    my_email = calendar.get('id', '')
+    return results
 
-    print("Fetching today's events...")
-    events = get_todays_events(service, args.calendar)
-    print(f"Found {len(events)} events")
 
-    if args.offset:
-        offset_minutes = args.offset
+def _oura_wake_error() -> dict:
+    print("Error: Could not get wake time from Oura.")
+    print("Use --offset to specify offset manually.")
+    return {'status': 'error', 'error': 'could not get wake time from Oura'}
+
+
+def run_shift(offset: Optional[int] = None, dry_run: bool = False, calendar_id: str = 'primary',
+              service=None, use_cache: bool = True, use_wake_cache: bool = True) -> dict:
+    """Shift today's solo events by the wake-up offset and return a summary.
+
+    Pass an already-built Calendar service to reuse it across calls. Set
+    use_wake_cache=False to always ask Oura for the latest wake time, e.g.
+    when a new sleep session has just been reported.
+    """
+    use_wake_cache = use_cache and use_wake_cache
+    today = datetime.now().date()
+    actual_wake = None
+
+    if not offset and use_cache:
+        cached_expected = load_wake_time(EXPECTED_WAKE_CACHE_FILE, today, calendar_id)
+        if cached_expected:
+            # With the expected wake time cached, an on-time morning needs
+            # nothing from Google at all
+            print("Fetching wake time from Oura Ring...")
+            actual_wake = get_oura_wake_time(use_wake_cache)
+            # Oura was already tried; don't fetch (or re-authorize) a second time
+            if not actual_wake:
+                return _oura_wake_error()
+
+            expected_wake = parse_datetime(cached_expected)
+            offset_minutes = calculate_offset(actual_wake, expected_wake)
+            if offset_minutes <= 0:
+                print(f"Expected wake (cached): {expected_wake.strftime('%H:%M')}")
+                print(f"Actual wake (Oura): {actual_wake.strftime('%H:%M')}")
+                print(f"Offset: {offset_minutes} minutes ({offset_minutes/60:.1f} hours)")
+                print("You woke up on time or early! No shifting needed.")
+                return {'status': 'on_time', 'offset_minutes': offset_minutes}
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Oura and Google are independent, so fetch the wake time while the
+        # Calendar requests are in flight
+        wake_future = None
+        if not offset and actual_wake is None:
+            print("Fetching wake time from Oura Ring...")
+            wake_future = executor.submit(get_oura_wake_time, use_wake_cache)
+
+        if service is None:
+            print("Authenticating with Google Calendar...")
+            service = get_calendar_service()
+
+        calendar = service.calendars().get(calendarId=calendar_id).execute()
+        my_email = calendar.get('id', '')
+
+        print("Fetching today's events...")
+        events = get_todays_events(service, calendar_id, use_cache)
+        print(f"Found {len(events)} events")
+
+    if offset:
+        offset_minutes = offset
         print(f"Using manual offset: {offset_minutes} minutes")
     else:
-        print("Fetching wake time from Oura Ring...")
-        actual_wake = get_oura_wake_time()
+        if wake_future is not None:
+            actual_wake = wake_future.result()
 
         if not actual_wake:
-            print("Error: Could not get wake time from Oura.")
-            print("Use --offset to specify offset manually.")
-            exit(1)
+            return _oura_wake_error()
 
         expected_wake = get_expected_wake_time(events)
 
         if not expected_wake:
             print("Error: Could not determine expected wake time from Sleep event.")
             print("Use --offset to specify offset manually.")
-            exit(1)
+            return {'status': 'error', 'error': 'could not determine expected wake time'}
 
-        actual_wake_naive = actual_wake.replace(tzinfo=None) if actual_wake.tzinfo else actual_wake
-        expected_wake_naive = expected_wake.replace(tzinfo=None) if expected_wake.tzinfo else expected_wake
+        save_wake_time(EXPECTED_WAKE_CACHE_FILE, today, expected_wake.isoformat(), calendar_id)
+        offset_minutes = calculate_offset(actual_wake, expected_wake)
 
-        offset_delta = actual_wake_naive - expected_wake_naive
-        offset_minutes = int(offset_delta.total_seconds() / 60)
-
-        print(f"Expected wake: {expected_wake_naive.strftime('%H:%M')}")
-        print(f"Actual wake (Oura): {actual_wake_naive.strftime('%H:%M')}")
+        print(f"Expected wake: {expected_wake.strftime('%H:%M')}")
+        print(f"Actual wake (Oura): {actual_wake.strftime('%H:%M')}")
 
     print(f"Offset: {offset_minutes} minutes ({offset_minutes/60:.1f} hours)")
 
     if offset_minutes <= 0:
         print("You woke up on time or early! No shifting needed.")
-        exit(0)
+        return {'status': 'on_time', 'offset_minutes': offset_minutes}
 
-    shifted = 0
+    # Classify each event once, keeping (event, summary, start) for the ones to shift
+    to_shift = []
     skipped = 0
+    # Per-event lines are buffered and written once at the end
+    log_lines = []
 
     for event in events:
         summary = event.get('summary', 'Untitled')
-
-        if any(name in summary.lower() for name in SLEEP_EVENT_NAMES):
-            print(f"  SKIP (sleep event): {summary}")
-            skipped += 1
+        start_time = event.get('start', {}).get('dateTime')
+
+        if _SLEEP_RE.search(summary):
+            reason = 'sleep event'
+        elif not start_time:
+            reason = 'all-day'
+        elif not is_solo_event(event, my_email):
+            reason = 'has attendees'
+        else:
+            start_dt = parse_datetime(start_time)
+            to_shift.append((event, summary, start_dt))
             continue
 
-        if 'date' in event.get('start', {}):
-            print(f"  SKIP (all-day): {summary}")
-            skipped += 1
-            continue
+        log_lines.append(f"  SKIP ({reason}): {summary}")
+        skipped += 1
+
+    results = {}
+    if to_shift and not dry_run:
+        results = shift_events(service, [event for event, _, _ in to_shift], offset_minutes, calendar_id)
 
-        if not is_solo_event(event, my_email):
-            print(f"  SKIP (has attendees): {summary}")
-            skipped += 1
+    shifted = 0
+    failed = 0
+
+    for event, summary, start_dt in to_shift:
+        new_start = start_dt + timedelta(minutes=offset_minutes)
+        times = f"({start_dt.strftime('%H:%M')} -> {new_start.strftime('%H:%M')})"
+
+        if dry_run:
+            log_lines.append(f"  WOULD SHIFT: {summary} {times}")
+        elif results.get(event['id']) is not None:
+            log_lines.append(f"  FAILED: {summary} {times}: {results[event['id']]}")
+            failed += 1
             continue
+        else:
+            log_lines.append(f"  SHIFTED: {summary} {times}")
+        shifted += 1
 
-        start_time = event.get('start', {}).get('dateTime', '')
-        if start_time:
-            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-            new_start = start_dt + timedelta(minutes=offset_minutes)
+    if log_lines:
+        sys.stdout.write('\n'.join(log_lines) + '\n')
+        sys.stdout.flush()
 
-            if args.dry_run:
-                print(f"  WOULD SHIFT: {summary} ({start_dt.strftime('%H:%M')} -> {new_start.strftime('%H:%M')})")
-            else:
-                shift_event(service, event, offset_minutes, args.calendar)
-                print(f"  SHIFTED: {summary} ({start_dt.strftime('%H:%M')} -> {new_start.strftime('%H:%M')})")
-            shifted += 1
+    print(f"\nDone! Shifted: {shifted}, Skipped: {skipped}, Failed: {failed}")
 
-    print(f"\nDone! Shifted: {shifted}, Skipped: {skipped}")
+    return {
+        'status': 'dry_run' if dry_run else 'shifted',
+        'offset_minutes': offset_minutes,
+        'shifted': shifted,
+        'skipped': skipped,
+        'failed': failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shift calendar events when waking up late')
+    parser.add_argument('--offset', type=int, help='Offset in minutes (overrides Oura detection)')
+    parser.add_argument('--dry-run', action='store_true', help='Preview without making changes')
+    parser.add_argument('--calendar', type=str, default='primary', help='Calendar ID to use')
+    parser.add_argument('--no-cache', action='store_true', help='Always fetch wake time and events fresh')
+    args = parser.parse_args()
+
+    try:
+        result = run_shift(offset=args.offset, dry_run=args.dry_run, calendar_id=args.calendar,
+                           use_cache=not args.no_cache)
+    except CalendarAuthError as e:
+        print(f"Error: {e}")
+        exit(1)
+
+    if result['status'] == 'error':
+        exit(1)
 
 
 if __name__ == '__main__':
@@ -11,9 +11,11 @@ Usage:
 """
 
 import argparse
-import json
 import os
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 OURA_CREDENTIALS_FILE = os.path.join(SCRIPT_DIR, 'oura_credentials.json')
@@ -22,17 +24,29 @@ OURA_TOKEN_FILE = os.path.join(SCRIPT_DIR, 'oura_token.json')
 OURA_API_BASE = 'https://api.ouraring.com/v2'
 VERIFICATION_TOKEN = 'calendar-shift-webhook-secret'
 
+# Seconds to wait for Oura to connect or send data before giving up
+OURA_TIMEOUT = 10
+
+# Shared session so Oura requests reuse pooled keep-alive connections
+_OURA = requests.Session()
+_OURA.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False),
+))
+
 
 def load_credentials():
     """Load Oura OAuth credentials."""
-    with open(OURA_CREDENTIALS_FILE, 'r') as f:
-        return json.load(f)
+    with open(OURA_CREDENTIALS_FILE, 'rb') as f:
+        return orjson.loads(f.read())
 
 
 def load_token():
     """Load Oura OAuth token."""
-    with open(OURA_TOKEN_FILE, 'r') as f:
-        return json.load(f)
+    with open(OURA_TOKEN_FILE, 'rb') as f:
+        return orjson.loads(f.read())
 
 
 def get_headers():
@@ -49,13 +63,14 @@ def get_headers():
 
 def list_subscriptions():
     """List existing webhook subscriptions."""
-    response = requests.get(
+    response = _OURA.get(
         f'{OURA_API_BASE}/webhook/subscription',
-        headers=get_headers()
+        headers=get_headers(),
+        timeout=OURA_TIMEOUT
     )
 
     if response.status_code == 200:
-        data = response.json()
+        data = orjson.loads(response.content)
         print("Current webhook subscriptions:")
 
         # Handle both list and dict response formats
@@ -91,14 +106,15 @@ def create_subscription(callback_url: str):
     print(f"  Data type: sleep")
     print(f"  Event type: create")
 
-    response = requests.post(
+    response = _OURA.post(
         f'{OURA_API_BASE}/webhook/subscription',
         headers=get_headers(),
-        json=payload
+        data=orjson.dumps(payload),
+        timeout=OURA_TIMEOUT
     )
 
     if response.status_code in (200, 201):
-        result = response.json()
+        result = orjson.loads(response.content)
         print(f"\nSuccess! Subscription created:")
         print(f"  ID: {result.get('id')}")
         print(f"  Expiration: {result.get('expiration_time')}")
@@ -111,9 +127,10 @@ def create_subscription(callback_url: str):
 
 def delete_subscription(subscription_id: str):
     """Delete a webhook subscription."""
-    response = requests.delete(
+    response = _OURA.delete(
         f'{OURA_API_BASE}/webhook/subscription/{subscription_id}',
-        headers=get_headers()
+        headers=get_headers(),
+        timeout=OURA_TIMEOUT
     )
 
     if response.status_code in (200, 204):
@@ -9,37 +9,127 @@ Run with: python webhook_server.py
 Expose with: cloudflared tunnel --url http://localhost:5000
 """
 
-import hashlib
 import hmac
-import json
 import os
-import subprocess
-import sys
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify
+import orjson
+from flask import Flask, Response, request
+from flask.json.provider import JSONProvider
+from waitress import serve
+
+from calendar_shift import (
+    get_calendar_service,
+    load_oura_credentials,
+    load_oura_token,
+    refresh_oura_token,
+    run_shift,
+)
 
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 VERIFICATION_TOKEN = os.environ.get('OURA_WEBHOOK_TOKEN', 'calendar-shift-webhook-secret')
+_HMAC_KEY = VERIFICATION_TOKEN.encode()
+
+# Refresh the Oura token this many seconds before it expires
+OURA_REFRESH_LEAD = 300
+# Retry delay when a background refresh fails
+OURA_REFRESH_RETRY = 600
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Static start of the /health body, which only varies by timestamp
+_HEALTH_PREFIX = b'{"status":"ok","timestamp":"'
+
+# Calendar service shared across webhooks, built on first use
+_service = None
+_service_lock = threading.Lock()
+# The shared service isn't thread-safe, and overlapping shifts would move
+# events twice, so shifts run one at a time
+_shift_lock = threading.Lock()
+
+
+def get_service():
+    """Return the shared Google Calendar service, building it if needed."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            # Never start the browser OAuth flow from a webhook request
+            _service = get_calendar_service(interactive=False)
+        return _service
+
+
+def schedule_oura_refresh():
+    """Refresh the Oura token in the background shortly before it expires.
+
+    Keeps the token refresh off the webhook's critical path.
+    """
+    token_data = load_oura_token()
+    if not token_data or 'expires_at' not in token_data:
+        return
+
+    delay = token_data['expires_at'] - datetime.now().timestamp() - OURA_REFRESH_LEAD
+    timer = threading.Timer(max(delay, 0), _refresh_oura_token)
+    timer.daemon = True
+    timer.start()
+
+
+def _refresh_oura_token():
+    credentials = load_oura_credentials()
+    token_data = load_oura_token()
+    if not credentials or not token_data:
+        return
+
+    try:
+        new_token = refresh_oura_token(credentials, token_data)
+    except Exception as e:
+        print(f"  Oura token refresh error: {e}")
+        new_token = None
+
+    if new_token:
+        print(f"[{datetime.now().isoformat()}] Refreshed Oura token")
+        schedule_oura_refresh()
+    else:
+        print(f"[{datetime.now().isoformat()}] Oura token refresh failed, retrying later")
+        timer = threading.Timer(OURA_REFRESH_RETRY, _refresh_oura_token)
+        timer.daemon = True
+        timer.start()
+
+
+def _json(obj, status=200):
+    """Build a JSON response from pre-serialized orjson bytes."""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
 
 
 def verify_signature(payload: bytes, signature: str) -> bool:
     """Verify Oura webhook signature."""
     if not signature:
         return False
-    expected = hmac.new(
-        VERIFICATION_TOKEN.encode(),
-        payload,
-        hashlib.sha256
-    ).hexdigest()
-    return hmac.compare_digest(signature, expected)
+    try:
+        signature_bytes = bytes.fromhex(signature)
+    except ValueError:
+        return False
+    expected = hmac.digest(_HMAC_KEY, payload, 'sha256')
+    return hmac.compare_digest(signature_bytes, expected)
 
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+    return Response(
+        _HEALTH_PREFIX + datetime.now().isoformat().encode() + b'"}',
+        mimetype='application/json'
+    )
 
 
 @app.route('/webhook/oura', methods=['POST'])
@@ -54,11 +144,11 @@ def oura_webhook():
     # Verify signature (optional but recommended)
     # if not verify_signature(request.data, signature):
     #     print("  Invalid signature!")
-    #     return jsonify({'error': 'invalid signature'}), 401
+    #     return _json({'error': 'invalid signature'}, 401)
 
     try:
         data = request.json
-        print(f"  Payload: {json.dumps(data, indent=2)}")
+        print(f"  Payload: {orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()}")
 
         event_type = data.get('event_type')
         data_type = data.get('data_type')
@@ -69,28 +159,21 @@ def oura_webhook():
         if data_type == 'sleep' and event_type == 'create':
             print("  New sleep data detected! Running calendar shift...")
 
-            # Run the calendar shift script
-            result = subprocess.run(
-                [sys.executable, os.path.join(SCRIPT_DIR, 'calendar_shift.py')],
-                capture_output=True,
-                text=True,
-                cwd=SCRIPT_DIR
-            )
-
-            print(f"  Script output:\n{result.stdout}")
-            if result.stderr:
-                print(f"  Script errors:\n{result.stderr}")
+            with _shift_lock:
+                # The webhook means Oura has a new session, so a cached wake
+                # time from an earlier one would be stale
+                result = run_shift(service=get_service(), use_wake_cache=False)
 
-            return jsonify({
+            return _json({
                 'status': 'processed',
-                'calendar_shift': result.returncode == 0
+                'calendar_shift': result
             })
 
-        return jsonify({'status': 'ignored', 'reason': 'not sleep create event'})
+        return _json({'status': 'ignored', 'reason': 'not sleep create event'})
 
     except Exception as e:
         print(f"  Error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
 
 
 @app.route('/webhook/oura', methods=['GET'])
@@ -101,8 +184,8 @@ def oura_webhook_verify():
     if challenge:
         print(f"Verification challenge: {challenge}")
         # Return as JSON with the challenge value
-        return jsonify({'challenge': challenge})
-    return jsonify({'status': 'ready'})
+        return _json({'challenge': challenge})
+    return _json({'status': 'ready'})
 
 
 if __name__ == '__main__':
@@ -113,4 +196,6 @@ if __name__ == '__main__':
     print("  cloudflared tunnel --url http://localhost:5050")
     print("\nThen create webhook subscription with that URL + /webhook/oura")
 
-    app.run(host='0.0.0.0', port=5050, debug=True)
+    schedule_oura_refresh()
+
+    serve(app, host='0.0.0.0', port=5050, threads=4)